@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 
 import logging
+from functools import lru_cache
+from shutil import which
 
 _LOGGER = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=32)
 def find_bin_in_path(binary_name: str) -> str:
     """Find location of binary_name in PATH
 
+    The result is cached, so PATH is only walked the first time a given binary is looked up.
+
     Args:
         binary_name: name of binary to search path for
 
@@ -18,12 +23,9 @@ def find_bin_in_path(binary_name: str) -> str:
         ValueError: the binary is not found in the path
 
     """
-    import os
-
-    for path in os.environ["PATH"].split(os.pathsep):
-        bin_full_path = os.path.join(path, binary_name)
-        if os.access(bin_full_path, os.X_OK):
-            _LOGGER.debug(f"found tmux: {bin_full_path}")
-            return bin_full_path
+    bin_full_path = which(binary_name)
+    if bin_full_path is None:
+        raise ValueError(f"{binary_name} not found in PATH")
 
-    raise ValueError(f"{binary_name} not found in PATH")
+    _LOGGER.debug("found %s: %s", binary_name, bin_full_path)
+    return bin_full_path
@@ -1,26 +1,23 @@
 #!/usr/bin/env python3
 
 import logging
-import re
+import os
+import signal
 import sys
-from collections import deque
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter
 from shutil import get_terminal_size
-from time import sleep
-from typing import Dict, List, Tuple
-
-from rich import print
-from rich.console import Console
-from rich.prompt import Prompt
+from types import FrameType
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 from scry.tmuxcmd import TmuxFmtCmd, tmux_attach, tmux_create_detached
 
-# import readline
+if TYPE_CHECKING:
+    from rich.console import Console
 
-logging.basicConfig(
-    format="%(asctime)s %(levelname)s: %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    level=logging.INFO,
-)
+# import readline
 
 _LOGGER = logging.getLogger("")
 
@@ -33,60 +30,104 @@ OPTION_HELP = {
     "?": "Help",
 }
 
+_PROMPT_MARKUP = f"Attach [bold magenta]\[{'/'.join(OPTION_HELP)}][/]"
+""" str: prompt shown under the session table. It only depends on OPTION_HELP, so it's built once
+"""
+
+_HELP_TEXT = "\n".join(f"\t\t{cmd}\t{help}" for cmd, help in OPTION_HELP.items())
+""" str: help screen listing each command in OPTION_HELP
+"""
 
-SESSION_HISTORY: deque = deque()
+# Most recently attached session ids, oldest first. Used as an LRU so membership and move-to-end are O(1)
+SESSION_HISTORY: "OrderedDict[str, None]" = OrderedDict()
 DEBUG = False
 
+# Erase the screen and move the cursor home, which is what console.clear() sends
+_CLEAR_SCREEN = "\x1b[2J\x1b[H"
+
+# The last table we rendered, and the inputs it was rendered from
+_FRAME_CACHE: Dict[str, Any] = {"key": None, "frame": "", "lines_printed": 0}
+
+# Last terminal size we read. Only kept when we get SIGWINCH to tell us it's out of date.
+_TERMINAL_SIZE: Dict[str, Optional[os.terminal_size]] = {"size": None}
+
+# Highlighting for the most recently attached sessions, most recent first
+_HISTORY_STYLES = ("[bold reverse magenta]", "[bold italic green]", "[bold italic blue]")
+
 
 config = {
     "minnamelen": 15,
     "n_cols": 5,
     "fmt_overhead": 6,
+    "history_len": 32,
 }
 
 
 def do_table_loop():
+    # Logging is set up here rather than at import, so importing the module has no side effects.
+    # basicConfig is a no-op if logging is already configured.
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        level=logging.INFO,
+    )
+
+    if hasattr(signal, "SIGWINCH"):
+        signal.signal(signal.SIGWINCH, _on_resize)
+
+    # rich is by far the most expensive thing we import, so wait until we're actually drawing to load it
+    from rich.console import Console
+    from rich.prompt import Prompt
+
     console = Console()
+    prompt = Prompt(_PROMPT_MARKUP, console=console)
     display_error_message = ""
+    refresh_sessions = True
 
     while True:
         # Clear some loop variables
         session_to_attach: str = None
 
-        sessions = tmux_list_sessions()
+        # Read the terminal size once per tick and hand it to everything that needs it, rich included
+        terminal_size = current_terminal_size()
+        console.size = terminal_size
 
-        # Check to see if our previous session still exits. If not, we'll need to remove it from the history
-        if len(SESSION_HISTORY) > 0:
-            previous_session = SESSION_HISTORY[-1]
-            if not next(
-                (session for session in sessions if session["session_id"] == previous_session),
-                None,
-            ):
-                SESSION_HISTORY.pop()
+        # Only ask tmux for the sessions again if something might have changed them since we last did:
+        # we've been attached to one, or we've been asked to update. Otherwise (help, a bad command) we
+        # reuse the list we already have, which also keeps the indexes matching what's on screen.
+        if refresh_sessions:
+            sessions = tmux_list_sessions()
+            sessions_by_id = {session["session_id"]: session for session in sessions}
+            sessions_by_name = {session["session_name"]: session for session in sessions}
+            refresh_sessions = False
+
+            # Check to see if the sessions in our history still exist. If not, we'll need to remove them
+            for stale_session in [session_id for session_id in SESSION_HISTORY if session_id not in sessions_by_id]:
+                del SESSION_HISTORY[stale_session]
 
-        console.clear()
-        lines_printed = draw_table(console, sessions)
-        console.line(console.size.height - lines_printed - 2)
+        lines_printed = draw_table(console, sessions, terminal_size)
 
+        # Pad down to the bottom of the screen, leaving one line for an error message and one for the prompt
+        padding = "\n" * max(0, terminal_size.lines - lines_printed - 2)
         if display_error_message:
-            console.print(f"Error: {display_error_message}")
+            console.print(f"{padding}Error: {display_error_message}")
             display_error_message = ""
         else:
-            console.line()
+            console.print(padding)
 
-        short_options = "/".join(OPTION_HELP.keys())
-        command = Prompt.ask(f"Attach [bold magenta]\[{short_options}][/]")
+        command = prompt()
 
         if command == "":
             # If we have a session history, just attach the most recent one. If not, noop.
             if len(SESSION_HISTORY) > 0:
-                tmux_attach(SESSION_HISTORY[-1])
+                tmux_attach(recent_sessions(1)[0])
+                refresh_sessions = True
             else:
                 continue
 
         elif command == "s":
             if len(SESSION_HISTORY) > 1:
-                session_to_attach = SESSION_HISTORY[-2]
+                session_to_attach = recent_sessions(2)[1]
             else:
                 continue
 
@@ -94,29 +135,44 @@ def do_table_loop():
             session_name = command.split()[1]
 
             if not validate_session_name(session_name):
-                _print_err("Invalid session name!")
+                display_error_message = "Invalid session name"
                 continue
 
+            # tmux hands us back the new session's id, so there's no need to list sessions again
             try:
-                tmux_create_detached(session_name)
+                session_to_attach = tmux_create_detached(session_name)
             except RuntimeError as e:
-                if "bad session name" in str(e):
+                if "duplicate session" in str(e):
+                    # We already have one by that name, so just attach it. If it isn't in our list, it was
+                    # made somewhere else since we last looked, so ask tmux again.
+                    session = sessions_by_name.get(session_name)
+                    if session is None:
+                        session = next(
+                            (session for session in tmux_list_sessions() if session["session_name"] == session_name),
+                            None,
+                        )
+
+                    if session is None:
+                        display_error_message = f"Unable to find session {session_name}"
+                        continue
+                    session_to_attach = session["session_id"]
+                elif "bad session name" in str(e):
                     display_error_message = "Invalid tmux session name"
                     continue
+                else:
+                    display_error_message = f"Unable to create session {session_name}"
+                    continue
 
-            sessions = tmux_list_sessions()
-            session_to_attach = next(
-                (session["session_id"] for session in sessions if session["session_name"] == session_name),
-                None,
-            )
-
-        elif command.isdecimal():
-            # We know we have an index number. Find the session and attach it
-            session_idx = int(command)
-
+        elif command[:1].isdigit():
+            # Looks like an index number. Find the session and attach it
             try:
+                session_idx = int(command)
+            except ValueError:
+                session_idx = -1
+
+            if 0 <= session_idx < len(sessions):
                 session_to_attach = sessions[session_idx]["session_id"]
-            except IndexError:
+            else:
                 display_error_message = "Invalid index"
                 continue
 
@@ -124,38 +180,57 @@ def do_table_loop():
             sys.exit(0)
 
         elif command == "?":
-            for cmd, help in OPTION_HELP.items():
-                console.print(f"\t\t{cmd}\t{help}")
+            console.print(_HELP_TEXT)
             console.line(2)
             _ = console.input("\[Enter to continue]")
 
         elif command == "u":
+            refresh_sessions = True
             continue
 
         else:
             display_error_message = f'command "{command}" not recognized'
 
         if session_to_attach:
-            # If we're just reattaching the same one we were just in, don't alter the history
-            if len(SESSION_HISTORY) == 0:
-                SESSION_HISTORY.append(session_to_attach)
-            elif session_to_attach != SESSION_HISTORY[-1]:
-                # If we have it somewhere else in the history, just remove it.
-                if session_to_attach in SESSION_HISTORY:
-                    SESSION_HISTORY.remove(session_to_attach)
-                SESSION_HISTORY.append(session_to_attach)
+            # Make this the most recent session, moving it up if we have it somewhere else in the history,
+            # and forget the oldest one if that takes us over the limit
+            SESSION_HISTORY[session_to_attach] = None
+            SESSION_HISTORY.move_to_end(session_to_attach)
+            if len(SESSION_HISTORY) > config["history_len"]:
+                SESSION_HISTORY.popitem(last=False)
 
             tmux_attach(session_to_attach)
+            refresh_sessions = True
+
+
+def _on_resize(signum: int, frame: Optional[FrameType]) -> None:
+    _TERMINAL_SIZE["size"] = None
 
 
-def _print_err(err: str) -> None:
-    print(f"Error: {err}")
-    sleep(0.5)
+def current_terminal_size() -> os.terminal_size:
+    """Return the size of the terminal, only asking the terminal again after it has been resized"""
+    terminal_size = _TERMINAL_SIZE["size"]
+    if terminal_size is None:
+        terminal_size = get_terminal_size()
 
+        # Without SIGWINCH we'd never hear about a resize, so don't hang on to it
+        if hasattr(signal, "SIGWINCH"):
+            _TERMINAL_SIZE["size"] = terminal_size
 
+    return terminal_size
+
+
+def recent_sessions(n: int) -> List[str]:
+    """Return up to n session ids from the history, most recent first"""
+    return list(islice(reversed(SESSION_HISTORY), n))
+
+
+@lru_cache(maxsize=1024)
 def format_session_name(name: str, maxlen: int) -> str:
     """Format the tmux session_name, removing middle chars if it is too long
 
+    Session names rarely change between redraws, so results are cached.
+
     Args:
         name: session name
         maxlen: maximum size of string to return
@@ -169,41 +244,94 @@ def format_session_name(name: str, maxlen: int) -> str:
 
     # Our name is too long. Trim some chars in the middle and replace with '*'
     startchars = maxlen // 2
-    new_name = name[:startchars] + "*" + name[-(maxlen - startchars - 1):]
-    return new_name
+    return f"{name[:startchars]}*{name[-(maxlen - startchars - 1):]}"
 
 
 def validate_session_name(s: str) -> bool:
-    session_name_regex = r"^[\w+]+$"
-    if re.match(session_name_regex, s):
+    """Check that a session name only contains word characters and '+'
+
+    str.isalnum() accepts exactly the same characters as a regex word character class, apart from '_',
+    and it's quicker than going through the regex engine.
+
+    Args:
+        s: session name to validate
+
+    Returns:
+        bool: whether the name is valid
+
+    """
+    # Most names are plain letters and digits, which one isalnum() call settles
+    if s.isalnum():
         return True
-    else:
-        return False
 
+    stripped = s.replace("_", "").replace("+", "")
+    return bool(s) and (not stripped or stripped.isalnum())
+
+
+def draw_table(console: "Console", sessions: List[Dict[str, str]], terminal_size: os.terminal_size) -> int:
+    """Clear the screen and draw the session table, reusing the last rendered frame if nothing on it has changed
+
+    Args:
+        console: console to draw on
+        sessions: sessions to display, in display order
+        terminal_size: size of the terminal we're drawing in
+
+    Returns:
+        int: number of lines printed
+
+    """
+    n_cols, column_width = get_column_width(terminal_size)
 
-def draw_table(console: Console, sessions: List[Dict[str, str]]) -> int:
+    # Everything that can change what the table looks like. The full history only shows up in debug output.
+    frame_key = (
+        tuple((session["session_id"], session["session_name"], session["session_attached"]) for session in sessions),
+        tuple(SESSION_HISTORY) if DEBUG else tuple(recent_sessions(3)),
+        terminal_size,
+        n_cols,
+        column_width,
+    )
+
+    if frame_key != _FRAME_CACHE["key"]:
+        with console.capture() as capture:
+            lines_printed = _render_table(console, sessions, n_cols, column_width)
+
+        _FRAME_CACHE["key"] = frame_key
+        _FRAME_CACHE["frame"] = capture.get()
+        _FRAME_CACHE["lines_printed"] = lines_printed
+
+    # The frame is already rendered, so skip rich and write it straight out along with the clear, all in one go.
+    # Like console.clear(), only send the clear to a terminal that can handle it
+    clear = _CLEAR_SCREEN if console.is_terminal and not console.is_dumb_terminal else ""
+    console.file.write(clear + _FRAME_CACHE["frame"])
+    return _FRAME_CACHE["lines_printed"]
+
+
+def _render_table(console: "Console", sessions: List[Dict[str, str]], n_cols: int, column_width: int) -> int:
     lines_printed = 0
 
-    console.clear()
     console.rule(f"[bold]scry {len(sessions)}")
     console.line()
     lines_printed += 2
 
     if DEBUG:
         console.print(console.size)
-        console.print(f"Deque: {SESSION_HISTORY}")
+        console.print(f"History: {list(SESSION_HISTORY)}")
         console.print("")
         lines_printed += 3
 
     if len(sessions) == 0:
         return lines_printed
 
-    n_cols, column_width = get_column_width()
     items_per_col = (len(sessions) + n_cols - 1) // n_cols
 
     session_strings = format_session_strings(column_width, sessions)
 
+    # Build the whole table and hand it to rich in a single print, rather than paying for a render per
+    # cell. soft_wrap stops rich from word-wrapping rows that come out wider than the terminal; like the
+    # old per-cell prints, they're left for the terminal to deal with.
+    rows: List[str] = []
     for i in range(items_per_col):
+        row: List[str] = []
         for j in range(n_cols):
             index = j * items_per_col + i
 
@@ -211,29 +339,21 @@ def draw_table(console: Console, sessions: List[Dict[str, str]]) -> int:
             # row?
             if index >= len(session_strings):
                 break
-            console.print(session_strings[index], end="")
+            row.append(session_strings[index])
 
-        # print the newline since we're at the end of a row
-        console.print("")
+        rows.append("".join(row))
         lines_printed += 1
 
+    console.print("\n".join(rows), soft_wrap=True)
+
     return lines_printed
 
 
 def format_session_strings(column_width: int, sessions: List[Dict[str, str]]) -> List[str]:
     session_strings: List[str] = []
 
-    # How many characters do we need for the index numbers?
-    n_sessions = len(sessions)
-    if n_sessions > 1000:
-        # srsly?
-        raise RuntimeError(f"you have {n_sessions} sessions, which is too many")
-    elif n_sessions > 100:
-        idx_len = 3
-    elif n_sessions > 10:
-        idx_len = 2
-    else:
-        idx_len = 1
+    # How many characters do we need for the index numbers? Enough for the highest one.
+    idx_len = len(str(max(0, len(sessions) - 1)))
 
     # Get the max number of chars required to display all session ids
     session_id_len = max(len(x["session_id"]) for x in sessions)
@@ -241,63 +361,72 @@ def format_session_strings(column_width: int, sessions: List[Dict[str, str]]) ->
     fmt_overhead = config["fmt_overhead"]
     fmt_overhead += idx_len + session_id_len
 
-    for i, session in enumerate(sessions):
-        session_string = ""
+    # Everything below is constant for the whole table, so work it out once rather than per row
+    highlight = dict(zip(recent_sessions(len(_HISTORY_STYLES)), _HISTORY_STYLES))
+    attached_mark = "[bold italic]#"
+    minnamelen = config["minnamelen"]
+    format_name = format_session_name
+
+    # rich is already loaded by the time we're drawing, so this costs nothing at startup
+    from rich.markup import escape
 
-        if len(SESSION_HISTORY) > 0:
-            # We have at least one session in our history, the most recent. Highlight it
-            if session["session_id"] == SESSION_HISTORY[-1]:
-                session_string = "[bold reverse magenta]"
+    # One format string for the whole row: highlight, index, attached mark, then the name and a space
+    # padded out with dashes to the session id (long names just push the id along), then closing markup
+    name_width = max(0, column_width - fmt_overhead + 1)
+    dashes = "-" * name_width
+    row_fmt = f"{{}}{{:>{idx_len}d}}){{}}{{}} {{}}[{{:<{session_id_len}}}] {{}}".format
 
-        if len(SESSION_HISTORY) > 1:
-            if session["session_id"] == SESSION_HISTORY[-2]:
-                session_string = "[bold italic green]"
+    for i, session in enumerate(sessions):
+        session_id = session["session_id"]
 
-        if len(SESSION_HISTORY) > 2:
-            if session["session_id"] == SESSION_HISTORY[-3]:
-                session_string = "[bold italic blue]"
+        # Every style a cell opens is closed again at the end of it, so that cells can be joined up and
+        # handed to rich as one string of markup
+        style = highlight.get(session_id, "")
+        style_close = "[/]" if style else ""
 
-        session_string += f"{i:>{idx_len}d})"
         # If the session is attached anywhere, we want to put a hash in the list next to the name
         if session["session_attached"] == "1":
-            session_string += "[bold italic]#"
+            mark = attached_mark
+            style_close += "[/]"
         else:
-            session_string += " "
+            mark = " "
 
         # The name we use in the display may not be the actual session name, but instead may be
         # a shortened version, returned from format_session_name()
-        session_fmt_name = format_session_name(session["session_name"], config["minnamelen"])
+        session_fmt_name = format_name(session["session_name"], minnamelen)
 
-        session_string += session_fmt_name
-
-        session_string += " " + "-" * (column_width - len(session_fmt_name) - fmt_overhead)
-        session_string += f'[{session["session_id"]:<{session_id_len}}] '
-        session_strings.append(session_string)
+        # Pad on the name as it will be shown, then escape it so that a name like "[bold]x" isn't read as
+        # markup by rich
+        padding_start = len(session_fmt_name) + 1
+        padding = dashes[padding_start:]
+        session_strings.append(row_fmt(style, i, mark, escape(session_fmt_name), padding, session_id, style_close))
 
     return session_strings
 
 
-def get_column_width() -> Tuple[int, int]:
-    # A relatively dirty hack to figure out how many columns we can display
-    terminal_size = get_terminal_size()
-    n_cols = config["n_cols"] + 1
-    column_width: int = 0
+def get_column_width(terminal_size: os.terminal_size) -> Tuple[int, int]:
+    return _compute_column_width(terminal_size.columns, config["n_cols"], config["fmt_overhead"], config["minnamelen"])
+
 
-    while column_width < (config["fmt_overhead"] + config["minnamelen"] + 3):
-        n_cols -= 1
-        column_width = (terminal_size.columns - n_cols + 1) // n_cols
-        _LOGGER.debug(f"shrinking n_cols to {n_cols}")
+@lru_cache(maxsize=8)
+def _compute_column_width(columns: int, max_cols: int, fmt_overhead: int, minnamelen: int) -> Tuple[int, int]:
+    # Figure out how many columns we can display. n columns need one separator between each of them, so
+    # the widest n with (columns - n + 1) // n >= min_width is (columns + 1) // (min_width + 1). We always
+    # show at least one column, however narrow the terminal. The answer only changes when the terminal
+    # is resized, so it's cached on the inputs.
+    min_width = fmt_overhead + minnamelen + 3
+    n_cols = max(1, min(max_cols, (columns + 1) // (min_width + 1)))
+    column_width = (columns - n_cols + 1) // n_cols
+    _LOGGER.debug("using %d columns of width %d", n_cols, column_width)
 
     return n_cols, column_width
 
 
 def tmux_list_sessions() -> List[Dict[str, str]]:
-    try:
-        tmux_cmd = TmuxFmtCmd(["list-sessions"], ["session_id", "session_name", "session_attached"])
-    except RuntimeError as e:
-        if "no server running" in str(e):
-            # This is okay. It just means there's no server yet. We return an empty session
-            # list
-            return []
-
-    return sorted(tmux_cmd.stdout, key=lambda k: k["session_name"])
+    tmux_cmd = TmuxFmtCmd(["list-sessions"], ["session_id", "session_name", "session_attached"], no_server_ok=True)
+    if tmux_cmd.no_server:
+        # This is okay. It just means there's no server yet. We return an empty session
+        # list
+        return []
+
+    return sorted(tmux_cmd.stdout, key=itemgetter("session_name"))
@@ -13,40 +13,67 @@ tmux_binary = find_bin_in_path("tmux")
 """ str: fully qualified path of tmux binary
 """
 
-_TMUX_FORMAT_SEPARATOR = "__SEPARATOR__"
-""" str: Format separator to use for tmux -F format constructions
+_TMUX_FORMAT_SEPARATOR = "\x1f"
+""" str: Format separator to use for tmux -F format constructions. This is the ASCII unit separator, which
+tmux passes through untouched and which won't realistically turn up in a name.
+"""
+
+_TMUX_NO_SERVER_ERROR = b"no server running"
+""" bytes: start of the stderr message tmux gives when it finds a socket but no server behind it
+"""
+
+_TMUX_CONNECT_ERROR = b"error connecting to"
+""" bytes: start of the stderr message tmux gives when it can't connect to the socket at all
+"""
+
+_TMUX_NO_SOCKET_ERROR = b"(No such file or directory)"
+""" bytes: end of a connect error when there's no socket, which means no server has been started yet. Any other
+reason (permissions, a socket path that's too long) is a real error.
 """
 
 _LOGGER = logging.getLogger(__name__)
 
 
 class TmuxCmd(object):
-    def __init__(self, cmd_args: List[str]):
+    def __init__(self, cmd_args: List[str], no_server_ok: bool = False):
         """
 
         Args:
             cmd_args: arguments to pass to tmux binary
+            no_server_ok: if tmux says there's no server, set no_server instead of raising
         """
 
         self._tmux_bin = tmux_binary
         self._tmux_args = cmd_args
+        self._no_server_ok = no_server_ok
         self._cmd_executed: bool = False
         self._cmd: subprocess.CompletedProcess = None
+        self._no_server: bool = False
 
         self._execute_cmd()
 
     def _execute_cmd(self) -> None:
         cmd = subprocess.run([self._tmux_bin] + self._tmux_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-        _LOGGER.debug(f"{cmd.stdout}")
+        _LOGGER.debug("%s", cmd.stdout)
 
         if cmd.returncode != 0:
-            raise RuntimeError(f"tmux returned nonzero with stderr: {cmd.stderr}")
+            # For callers that expect it, no server just means nothing has been started yet. That's an answer
+            # rather than an error, so flag it and carry on with the (empty) output instead of raising.
+            if self._no_server_ok and _is_no_server_error(cmd.stderr):
+                self._no_server = True
+            else:
+                raise RuntimeError(f"tmux returned nonzero with stderr: {cmd.stderr}")
 
         # Set the executed flag and save the CompletedProcess obj
         self._cmd = cmd
         self._cmd_executed = True
 
+    @property
+    def no_server(self) -> bool:
+        """bool: whether tmux reported that there is no server running"""
+        return self._no_server
+
     @property
     def stdout(self) -> List[str]:
         if self._cmd_executed:
@@ -60,13 +87,13 @@ class TmuxCmd(object):
 class TmuxFmtCmd(TmuxCmd):
     """Like a regular TmuxCmd object, but we return a parsed stdout from a tmux format"""
 
-    def __init__(self, args: List[str], fmt_keys: List[str]):
+    def __init__(self, args: List[str], fmt_keys: List[str], no_server_ok: bool = False):
         self._fmt_keys = fmt_keys
 
         fmt_string = self._format_tmux_keys(fmt_keys)
         args += ["-F", fmt_string]
 
-        super(TmuxFmtCmd, self).__init__(args)
+        super(TmuxFmtCmd, self).__init__(args, no_server_ok)
 
     @staticmethod
     def _format_tmux_keys(fmt_keys: List[str]) -> str:
@@ -79,10 +106,12 @@ class TmuxFmtCmd(TmuxCmd):
     def stdout(self) -> List[Dict[str, str]]:
         if self._cmd_executed:
             _ret = list()
+            debug = _LOGGER.isEnabledFor(logging.DEBUG)
 
             stdout = self._cmd.stdout.decode("utf-8")
             for line in stdout.splitlines():
-                _LOGGER.debug(f"line: {line}")
+                if debug:
+                    _LOGGER.debug("line: %s", line)
                 line_vals = line.split(sep=_TMUX_FORMAT_SEPARATOR)
 
                 # Create a dict using the fmt_keys as the keys
@@ -93,8 +122,31 @@ class TmuxFmtCmd(TmuxCmd):
             raise ValueError("tmux command did not execute correctly; no stdout.")
 
 
-def tmux_create_detached(session_name: str):
-    subprocess.run([tmux_binary, "new-session", "-s", session_name, "-d"])
+def _is_no_server_error(stderr: bytes) -> bool:
+    """Whether tmux's stderr says there's no server running, as opposed to some other failure
+
+    tmux says "no server running" when it finds a stale socket, and "error connecting to <socket> (No such file
+    or directory)" when there's no socket at all.
+    """
+    if stderr.startswith(_TMUX_NO_SERVER_ERROR):
+        return True
+
+    return stderr.startswith(_TMUX_CONNECT_ERROR) and stderr.rstrip().endswith(_TMUX_NO_SOCKET_ERROR)
+
+
+def tmux_create_detached(session_name: str) -> str:
+    """Create a detached session, returning the session_id tmux assigned to it
+
+    Raises:
+        RuntimeError: tmux failed to create the session, or didn't tell us its id
+
+    """
+    tmux_cmd = TmuxCmd(["new-session", "-s", session_name, "-d", "-P", "-F", "#{session_id}"])
+    stdout = tmux_cmd.stdout
+    if tmux_cmd.no_server or not stdout:
+        raise RuntimeError(f"tmux did not return a session id for new session {session_name}")
+
+    return stdout[0]
 
 
 def tmux_attach(session_id: str):